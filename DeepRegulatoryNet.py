@@ -1,5 +1,7 @@
 import os
+import re
 import shutil
+import tempfile
 import argparse
 import sys
 import logging
@@ -20,24 +22,36 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'src'))
 from second_pipeline import SecondPipeline
 from enrichment_script import main as enrichment_main
 from ppi_script import PPI_Analysis
-from drug_gene_script import main as drug_gene_main
 
 
 # ---------- Logging Helpers ----------
 
+_CONSOLE_PREFIX_RE = re.compile(r"\[(?:START\]|STEP|SUCCESS\]|INFO\]|WELCOME\])")
+
+
 class AutoFlushFileHandler(logging.FileHandler):
+    """Flush on WARNING and above, otherwise every `flush_every` records."""
+
+    def __init__(self, *args, flush_every=50, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flush_every = flush_every
+        self._pending = 0
+
     def emit(self, record):
         super().emit(record)
-        self.flush()
+        self._pending += 1
+        if record.levelno >= logging.WARNING or self._pending >= self.flush_every:
+            self.flush()
+            self._pending = 0
 
 
 class ConciseConsoleFilter(logging.Filter):
     def filter(self, record):
-        msg = record.getMessage()
-        return (
-            record.levelname in ("ERROR", "WARNING") or
-            msg.startswith(("[START]", "[STEP", "[SUCCESS]", "[INFO]", "[WELCOME]"))
-        )
+        if record.levelname in ("ERROR", "WARNING"):
+            return True
+        # The prefix lives in the format string, so skip %-formatting when possible
+        msg = record.msg if isinstance(record.msg, str) else record.getMessage()
+        return _CONSOLE_PREFIX_RE.match(msg) is not None
 
 
 def setup_logging(log_file, debug=False):
@@ -82,12 +96,15 @@ circRNA-miRNA-mRNA Pipeline
 # ---------- Input Validation ----------
 
 def validate_input_format(file_path, expected_prefix=None):
-    with open(file_path, encoding='utf-8') as f:
-        lines = [line.strip() for line in f if line.strip()]
-    for line in lines:
-        if expected_prefix and not line.startswith(expected_prefix):
-            raise ValueError(f"Invalid ID format in {file_path}: '{line}'")
-    return lines
+    """Return the unique, non-empty IDs in file order; checks the prefix on raw bytes."""
+    with open(file_path, 'rb') as f:
+        lines = [line for line in (raw.strip() for raw in f.read().splitlines()) if line]
+    if expected_prefix:
+        prefix = expected_prefix.encode('utf-8')
+        bad = next((line for line in lines if not line.startswith(prefix)), None)
+        if bad is not None:
+            raise ValueError(f"Invalid ID format in {file_path}: '{bad.decode('utf-8', 'replace')}'")
+    return list(dict.fromkeys(line.decode('utf-8') for line in lines))
 
 
 # ---------- Main Pipeline ----------
@@ -95,6 +112,7 @@ def validate_input_format(file_path, expected_prefix=None):
 def run_analysis(circ_file, mirna_file, deg_file, debug=False):
     logger = logging.getLogger()
     start_time = time.time()
+    temp_dir = None
 
     try:
         circ_ids = validate_input_format(circ_file, "hsa_circ_")
@@ -111,10 +129,13 @@ def run_analysis(circ_file, mirna_file, deg_file, debug=False):
             if not os.path.exists(f):
                 raise FileNotFoundError(f"Missing file: {f}")
 
-        for folder in ["temp", "output"]:
-            if os.path.exists(folder):
-                shutil.rmtree(folder)
-            os.makedirs(folder)
+        if os.path.isdir("output"):
+            shutil.rmtree("output", ignore_errors=True)
+        os.makedirs("output", exist_ok=True)
+
+        # Intermediates stay on local disk and are discarded when the run ends
+        temp_dir = tempfile.mkdtemp(prefix="drn_")
+        logger.debug("[DEBUG] Temporary directory: %s", temp_dir)
 
         # -------- UPDATED ML PREDICTION ENGINE --------
         logger.info("--------------------------------------------------")
@@ -127,7 +148,7 @@ def run_analysis(circ_file, mirna_file, deg_file, debug=False):
             model_file,
             encoder_file,
             scaler_file,
-            "temp",
+            temp_dir,
             "output"
         )
 
@@ -192,6 +213,7 @@ def run_analysis(circ_file, mirna_file, deg_file, debug=False):
         logger.info("[STEP 5] Analyzing drug–gene interactions...")
         hub_genes_path = os.path.join("output", "hub_genes.csv")
         if os.path.exists(hub_genes_path):
+            from drug_gene_script import main as drug_gene_main
             drug_gene_main(hub_genes_path)
         else:
             logger.warning("[WARN] ⚠ Skipped drug–gene analysis: no hub genes file found (%s)", hub_genes_path)
@@ -210,6 +232,10 @@ def run_analysis(circ_file, mirna_file, deg_file, debug=False):
             logger.error(traceback.format_exc())
         sys.exit(1)
 
+    finally:
+        if temp_dir:
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
 
 # ---------- CLI ----------
 
@@ -1,11 +1,13 @@
 import os
 import json
+import hashlib
 import logging
 from datetime import datetime
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
-import pandas as pd
-import requests
-import matplotlib.pyplot as plt
+# pandas / requests / matplotlib are imported inside the functions that use
+# them, so importing this module at pipeline start-up stays cheap.
 
 # ──────────────────────────────────────────────
 # Configuration (default paths – will be overridden in main())
@@ -13,10 +15,40 @@ import matplotlib.pyplot as plt
 INPUT_FILE = "output/hub_genes.csv"        # CSV must contain a 'Gene' column
 OUTPUT_DIR = "output"
 OUTPUT_FULL_CSV = os.path.join(OUTPUT_DIR, "drug_gene_interactions.csv")
+OUTPUT_FULL_PARQUET = os.path.join(OUTPUT_DIR, "drug_gene_interactions.parquet")
 OUTPUT_BAR = os.path.join(OUTPUT_DIR, "drug_gene_interaction_barplot.png")
+WRITE_CSV = True  # also write the CSV copy alongside the Parquet file
 
 TOP_GENES = 15  # number of top genes to display in stacked bar chart
 
+DGIDB_URL = "https://dgidb.org/api/graphql"
+BATCH_SIZE = 25   # genes per GraphQL request
+MAX_WORKERS = 8   # concurrent DGIdb requests
+CACHE_DIR = ".dgidb_cache"  # kept outside OUTPUT_DIR, which is wiped on each run
+RESULT_CACHE_SIZE = 8       # gene sets whose merged DGIdb results stay in memory
+
+_result_cache = {}  # frozenset(genes) -> tuple of nodes, only for fully successful queries
+
+# Parameterised so the query text is constant across batches and runs
+DGIDB_QUERY = """
+query($names: [String!]!) {
+  genes(names: $names) {
+    nodes {
+      name
+      interactions {
+        drug { name conceptId }
+        interactionScore
+        interactionTypes { type directionality }
+        interactionAttributes { name value }
+        publications { pmid }
+        sources { sourceDbName }
+      }
+    }
+  }
+}
+"""
+QUERY_HASH = hashlib.sha1(DGIDB_QUERY.encode("utf-8")).hexdigest()
+
 os.makedirs(OUTPUT_DIR, exist_ok=True)
 
 # ──────────────────────────────────────────────
@@ -35,12 +67,20 @@ logger = setup_logging()
 # ──────────────────────────────────────────────
 # Load Genes
 # ──────────────────────────────────────────────
+@lru_cache(maxsize=32)
+def _load_gene_names_cached(file_path, mtime):
+    """Keyed on (path, mtime) so an edited file is re-read."""
+    import pandas as pd
+
+    df = pd.read_csv(file_path)
+    if "Gene" not in df.columns:
+        raise ValueError("CSV is missing a 'Gene' column.")
+    arr = df["Gene"].to_numpy()
+    return tuple(pd.unique(arr[pd.notna(arr)]).tolist())
+
 def load_gene_names(file_path):
     try:
-        df = pd.read_csv(file_path)
-        if "Gene" not in df.columns:
-            raise ValueError("CSV is missing a 'Gene' column.")
-        genes = df["Gene"].dropna().unique().tolist()
+        genes = list(_load_gene_names_cached(file_path, os.path.getmtime(file_path)))
         logger.info("Loaded %d unique genes.", len(genes))
         return genes
     except Exception as e:
@@ -50,127 +90,230 @@ def load_gene_names(file_path):
 # ──────────────────────────────────────────────
 # Query DGIdb GraphQL
 # ──────────────────────────────────────────────
-def query_dgidb(genes):
-    url = "https://dgidb.org/api/graphql"
-    query = f"""
-    {{
-      genes(names: {json.dumps(genes)}) {{
-        nodes {{
-          name
-          interactions {{
-            drug {{ name conceptId }}
-            interactionScore
-            interactionTypes {{ type directionality }}
-            interactionAttributes {{ name value }}
-            publications {{ pmid }}
-            sources {{ sourceDbName }}
-          }}
-        }}
-      }}
-    }}
+def _make_session():
+    """Session with a pooled, retrying HTTPS adapter shared by all batches."""
+    import requests
+    from requests.adapters import HTTPAdapter
+    from urllib3.util.retry import Retry
+
+    session = requests.Session()
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["POST"]),
+    )
+    adapter = HTTPAdapter(pool_connections=8, pool_maxsize=8, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+def _get_cache_path(batch):
+    key = hashlib.sha1(json.dumps([QUERY_HASH, sorted(batch)]).encode("utf-8")).hexdigest()
+    return os.path.join(CACHE_DIR, f"{key}.json")
+
+def _load_from_cache(batch):
+    cache_path = _get_cache_path(batch)
+    if os.path.exists(cache_path):
+        try:
+            with open(cache_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+    return None
+
+def _save_to_cache(batch, nodes):
+    try:
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        with open(_get_cache_path(batch), "w", encoding="utf-8") as f:
+            json.dump(nodes, f)
+    except Exception:
+        pass
+
+def _query_batch(batch, session):
+    """Query DGIdb for one batch of genes; successful responses are cached on disk.
+
+    Returns None when the request fails so callers can tell it apart from a batch
+    with no matches.
     """
+    cached = _load_from_cache(batch)
+    if cached is not None:
+        return cached
+
     try:
-        r = requests.post(url, json={"query": query}, timeout=60)
+        payload = {"query": DGIDB_QUERY, "variables": {"names": list(batch)}}
+        r = session.post(DGIDB_URL, json=payload, timeout=60)
         if r.status_code != 200:
             logger.error("DGIdb API error (%d): %s", r.status_code, r.text)
-            return []
-        return r.json().get("data", {}).get("genes", {}).get("nodes", [])
+            return None
+        nodes = r.json().get("data", {}).get("genes", {}).get("nodes", [])
+        _save_to_cache(batch, nodes)
+        return nodes
     except Exception as e:
         logger.error("DGIdb request failed: %s", e)
+        return None
+
+def query_dgidb(genes):
+    from tqdm import tqdm
+
+    key = frozenset(genes)
+    if key in _result_cache:
+        return list(_result_cache[key])
+
+    batches = [tuple(genes[i:i + BATCH_SIZE]) for i in range(0, len(genes), BATCH_SIZE)]
+    if not batches:
         return []
 
+    nodes = []
+    failed_batches = []
+    with _make_session() as session, ThreadPoolExecutor(max_workers=min(MAX_WORKERS, len(batches))) as executor:
+        futures = [executor.submit(_query_batch, batch, session) for batch in batches]
+        # Progress follows completion; the merge below follows submission order
+        # so output rows don't depend on thread timing
+        for _ in tqdm(as_completed(futures), total=len(futures), desc="DGIdb batches"):
+            pass
+        for batch, future in zip(batches, futures):
+            batch_nodes = future.result()
+            if batch_nodes is None:
+                failed_batches.append(batch)
+                continue
+            nodes.extend(batch_nodes)
+
+    if failed_batches:
+        logger.warning(
+            "DGIdb results are incomplete: %d of %d batches failed (%d of %d genes dropped).",
+            len(failed_batches), len(batches),
+            sum(len(b) for b in failed_batches), len(genes),
+        )
+
+    # Partial results are not memoised, so a later call retries the failed batches
+    if not failed_batches:
+        if len(_result_cache) >= RESULT_CACHE_SIZE:
+            _result_cache.pop(next(iter(_result_cache)))
+        _result_cache[key] = tuple(nodes)
+    return nodes
+
 # ──────────────────────────────────────────────
 # Extract Data (flatten)
 # ──────────────────────────────────────────────
+INTERACTION_COLUMNS = [
+    "Gene", "Drug", "Concept_ID", "Score", "Interaction_Types",
+    "Interaction_Attributes", "Publications_PMIDs", "Sources",
+]
+
 def extract_interactions(data):
-    records = []
+    import pandas as pd
+
+    # Column-wise lists (one per output column) instead of a dict per row
+    genes, drugs, concept_ids, scores = [], [], [], []
+    interaction_types, attributes, pmids, sources = [], [], [], []
     for item in data:
         gene = item.get("name", "")
-        for inter in item.get("interactions", []):
-            drug_info = inter.get("drug", {})
-            records.append({
-                "Gene": gene,
-                "Drug": drug_info.get("name", ""),
-                "Concept_ID": drug_info.get("conceptId", ""),
-                "Score": inter.get("interactionScore", 0),
-                "Interaction_Types": "; ".join([
-                    f"{t.get('type','')} ({t.get('directionality','')})"
-                    for t in inter.get("interactionTypes", [])
-                ]) or None,
-                "Interaction_Attributes": "; ".join([
-                    f"{a.get('name','')}={a.get('value','')}"
-                    for a in inter.get("interactionAttributes", [])
-                ]),
-                "Publications_PMIDs": "; ".join([
-                    str(p.get("pmid", "")) for p in inter.get("publications", [])
-                ]),
-                "Sources": "; ".join([
-                    s.get("sourceDbName", "") for s in inter.get("sources", [])
-                ])
-            })
-    df = pd.DataFrame(records)
+        for inter in item.get("interactions") or []:
+            drug_info = inter.get("drug") or {}
+            genes.append(gene)
+            drugs.append(drug_info.get("name", ""))
+            concept_ids.append(drug_info.get("conceptId", ""))
+            scores.append(inter.get("interactionScore", 0))
+            interaction_types.append("; ".join(
+                f"{t.get('type','')} ({t.get('directionality','')})"
+                for t in inter.get("interactionTypes") or []
+            ) or None)
+            attributes.append("; ".join(
+                f"{a.get('name','')}={a.get('value','')}"
+                for a in inter.get("interactionAttributes") or []
+            ))
+            pmids.append("; ".join(
+                str(p.get("pmid", "")) for p in inter.get("publications") or []
+            ))
+            sources.append("; ".join(
+                s.get("sourceDbName", "") for s in inter.get("sources") or []
+            ))
+
+    df = pd.DataFrame({
+        "Gene": genes,
+        "Drug": drugs,
+        "Concept_ID": concept_ids,
+        "Score": scores,
+        "Interaction_Types": interaction_types,
+        "Interaction_Attributes": attributes,
+        "Publications_PMIDs": pmids,
+        "Sources": sources,
+    }, columns=INTERACTION_COLUMNS)
+
+    # Low-cardinality columns → category; keeps groupby/nunique on int codes
+    for col in ("Gene", "Interaction_Types", "Sources"):
+        df[col] = df[col].astype("category")
+    df["Score"] = pd.to_numeric(df["Score"], downcast="float")
     logger.info("Extracted %d drug–gene interactions.", len(df))
     return df
 
 # ──────────────────────────────────────────────
-# Save Full CSV
+# Save Full Table (Parquet + optional CSV)
 # ──────────────────────────────────────────────
 def export_full_csv(df):
     try:
-        df.to_csv(OUTPUT_FULL_CSV, index=False)
-        logger.info("Full CSV saved → %s", OUTPUT_FULL_CSV)
+        df.to_parquet(OUTPUT_FULL_PARQUET, engine="pyarrow", compression="zstd", index=False)
+        logger.info("Full Parquet saved → %s", OUTPUT_FULL_PARQUET)
     except Exception as e:
-        logger.error("Failed to save full CSV: %s", e)
+        logger.error("Failed to save full Parquet: %s", e)
+
+    if WRITE_CSV:
+        try:
+            with open(OUTPUT_FULL_CSV, "w", buffering=1 << 20, newline="", encoding="utf-8") as f:
+                df.to_csv(f, index=False)
+            logger.info("Full CSV saved → %s", OUTPUT_FULL_CSV)
+        except Exception as e:
+            logger.error("Failed to save full CSV: %s", e)
 
 # ──────────────────────────────────────────────
 # Stacked Bar Plot
 # ──────────────────────────────────────────────
 def draw_stacked_bar(df):
+    import numpy as np
+    import pandas as pd
+    import matplotlib
+    matplotlib.use("Agg")  # headless: no GUI backend initialisation
+    import matplotlib.pyplot as plt
+
     # Ensure copy and fill missing interaction types
     stacked_df = df.copy()
-    stacked_df["Interaction_Types"] = stacked_df["Interaction_Types"].fillna("Unknown")
+    types = stacked_df["Interaction_Types"].astype("category")
+    if "Unknown" not in types.cat.categories:
+        types = types.cat.add_categories("Unknown")
+    stacked_df["Interaction_Types"] = types.fillna("Unknown")
 
     # Count unique drugs per gene & interaction type
-    gene_interaction_counts = (
-        stacked_df.groupby(["Gene", "Interaction_Types"])["Drug"]
-        .nunique()
-        .reset_index()
-    )
+    pivot_df = pd.crosstab(
+        stacked_df["Gene"],
+        stacked_df["Interaction_Types"],
+        values=stacked_df["Drug"],
+        aggfunc="nunique",
+    ).fillna(0)
 
-    # Pivot for stacked bar chart
-    pivot_df = (
-        gene_interaction_counts.pivot(
-            index="Gene", columns="Interaction_Types", values="Drug"
-        )
-        .fillna(0)
-    )
-
-    # Keep only top genes by number of unique drugs
-    top_genes = (
-        stacked_df.groupby("Gene")["Drug"]
-        .nunique()
-        .sort_values(ascending=False)
-        .head(TOP_GENES)
-        .index
-    )
-    pivot_df = pivot_df.loc[pivot_df.index.intersection(top_genes)]
+    # Keep only top genes by number of drugs
+    pivot_df = pivot_df.loc[pivot_df.sum(axis=1).nlargest(TOP_GENES).index]
 
     # Plot
-    ax = pivot_df.plot(
-        kind="bar",
-        stacked=True,
-        figsize=(12, 7),
-        colormap="tab20"
-    )
+    colors = plt.get_cmap("tab20")(np.linspace(0, 1, pivot_df.shape[1]))
+    values = pivot_df.to_numpy(dtype=float)
+    bottoms = np.cumsum(values, axis=1) - values  # stack offsets per segment
+    x = np.arange(len(pivot_df))
+
+    fig, ax = plt.subplots(figsize=(12, 7))
+    for i, interaction_type in enumerate(pivot_df.columns):
+        ax.bar(x, values[:, i], width=0.5, bottom=bottoms[:, i],
+               label=str(interaction_type), color=colors[i])
     ax.grid(True, which="both", axis="both", linestyle="--", alpha=0.6)
-    plt.title("Drugs per Gene by Interaction Type", fontsize=14, weight="bold")
-    plt.xlabel("Genes", fontsize=12)
-    plt.ylabel("Number of Drugs", fontsize=12)
-    plt.xticks(rotation=75, ha="right")
-    plt.legend(title="Interaction Type", bbox_to_anchor=(1.05, 1), loc="upper left")
-    plt.tight_layout()
-    plt.savefig(OUTPUT_BAR, dpi=300)
-    plt.close()
+    ax.set_title("Drugs per Gene by Interaction Type", fontsize=14, weight="bold")
+    ax.set_xlabel("Genes", fontsize=12)
+    ax.set_ylabel("Number of Drugs", fontsize=12)
+    ax.set_xticks(x)
+    ax.set_xlim(-0.5, len(x) - 0.5)
+    ax.set_xticklabels(pivot_df.index.astype(str), rotation=75, ha="right")
+    ax.legend(title="Interaction Type", bbox_to_anchor=(1.05, 1), loc="upper left")
+    fig.tight_layout()
+    fig.savefig(OUTPUT_BAR, dpi=150)
+    plt.close(fig)
     logger.info("Stacked bar plot saved → %s", OUTPUT_BAR)
 
 # ──────────────────────────────────────────────
@@ -204,7 +347,7 @@ def run_pipeline():
 # ──────────────────────────────────────────────
 # Main callable for pipeline integration
 # ──────────────────────────────────────────────
-def main(hub_genes_path="hub_genes.csv", output_dir="output"):
+def main(hub_genes_path="hub_genes.csv", output_dir="output", write_csv=True):
     """
     Run DGIdb drug–gene interaction pipeline.
     Parameters
@@ -212,12 +355,16 @@ def main(hub_genes_path="hub_genes.csv", output_dir="output"):
     hub_genes_path : str
         Path to CSV file containing a 'Gene' column (hub genes).
     output_dir : str
-        Directory where results (CSV + plot) will be saved.
+        Directory where results (Parquet/CSV + plot) will be saved.
+    write_csv : bool
+        Also write the interactions table as CSV next to the Parquet file.
     """
-    global INPUT_FILE, OUTPUT_DIR, OUTPUT_FULL_CSV, OUTPUT_BAR
+    global INPUT_FILE, OUTPUT_DIR, OUTPUT_FULL_CSV, OUTPUT_FULL_PARQUET, OUTPUT_BAR, WRITE_CSV
     INPUT_FILE = hub_genes_path
     OUTPUT_DIR = output_dir
     OUTPUT_FULL_CSV = os.path.join(OUTPUT_DIR, "drug_gene_interactions.csv")
+    OUTPUT_FULL_PARQUET = os.path.join(OUTPUT_DIR, "drug_gene_interactions.parquet")
+    WRITE_CSV = write_csv
     OUTPUT_BAR = os.path.join(OUTPUT_DIR, "drug_gene_interaction_barplot.png")
     os.makedirs(OUTPUT_DIR, exist_ok=True)
 
@@ -91,12 +91,9 @@ class PPI_Network:
             return pd.DataFrame(columns=["Gene", "Degree"])
         node_degrees = dict(ppi_graph.degree())
         mean_degree = sum(node_degrees.values()) / len(node_degrees) if node_degrees else 0
-        high_degree_genes = [gene for gene, degree in node_degrees.items() if degree > mean_degree]
-        logger.info("[INFO] ✔ %d hub genes (degree > mean)", len(high_degree_genes))
-        hub_data = pd.DataFrame(
-            [(gene, degree) for gene, degree in node_degrees.items() if gene in high_degree_genes],
-            columns=["Gene", "Degree"]
-        )
+        hub_rows = [(gene, degree) for gene, degree in node_degrees.items() if degree > mean_degree]
+        logger.info("[INFO] ✔ %d hub genes (degree > mean)", len(hub_rows))
+        hub_data = pd.DataFrame(hub_rows, columns=["Gene", "Degree"])
         hub_csv_file = os.path.join(self.result_dir, "hub_genes.csv")
         try:
             hub_data.to_csv(hub_csv_file, index=False)